@@ -1,47 +1,90 @@
 import os
+import re
 import json
+import base64
+import time
 import logging
 import decimal
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from botocore.exceptions import ClientError
 
+try:
+    import orjson  # optional (Lambda layer); falls back to stdlib json
+except ImportError:
+    orjson = None
+
 # ==== Settings (env-driven; sensible defaults for the exercise) ====
 TABLE_NAME = os.environ.get("TABLE_NAME", "Items")
+LIST_INDEX = os.environ.get("LIST_INDEX", "ByType")   # GSI: PK type / SK date
+ITEM_TYPE  = "item"                                   # constant partition for LIST_INDEX
+MAX_LIMIT  = 1000
+LIST_FIELDS = ("id", "description", "date")          # what the UI renders; ?fields= picks a subset
+BATCH_MAX  = 25                                       # BatchWriteItem per-call cap
+BATCH_RETRIES = 5
 CORS_ALLOW_ORIGIN  = os.environ.get("CORS_ALLOW_ORIGIN",  "*")
 CORS_ALLOW_HEADERS = os.environ.get("CORS_ALLOW_HEADERS", "Content-Type,Authorization")
 CORS_ALLOW_METHODS = os.environ.get("CORS_ALLOW_METHODS", "GET,POST,PUT,DELETE,OPTIONS")
 
-# ==== Clients (module-global reuse) ====
-db = boto3.resource("dynamodb").Table(TABLE_NAME)
+# ==== Clients (module-global reuse, built lazily) ====
+# Keep-alive + sized pool so warm invocations reuse the TLS connection
+_CLIENT_CONFIG = {
+    "tcp_keepalive": True,
+    "max_pool_connections": 10,
+    "retries": {"mode": "adaptive", "max_attempts": 3},
+}
+_ddb = _ser = _deser = None
+_prefetch = None   # next-page Query while the current page is processed (see _prefetcher)
 
 # ==== Logging ====
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # ==== JSON helpers ====
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, decimal.Decimal):
-            # Return int when exact integer, else float
-            return int(o) if o % 1 == 0 else float(o)
-        return super().default(o)
+def _default(o):
+    if isinstance(o, decimal.Decimal):
+        # DynamoDB numbers go out as exact decimal strings (no float round-trip)
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+if orjson:
+    def dumpb(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    def dumps(obj) -> str:
+        return dumpb(obj).decode()
+    loads = orjson.loads
+else:
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=_default)
+    def dumpb(obj) -> bytes:
+        return dumps(obj).encode()
+    loads = json.loads
 
-def dumps(obj) -> str:
-    return json.dumps(obj, ensure_ascii=False, cls=DecimalEncoder)
+def _encode_array(items) -> str:
+    """Encode an iterable as a JSON array one element at a time (no full list kept)."""
+    buf = bytearray(b"[")
+    for n, item in enumerate(items):
+        if n:
+            buf += b","
+        buf += dumpb(item)
+    buf += b"]"
+    return buf.decode()
 
 # ==== HTTP helpers ====
-def _headers():
-    return {
-        "Access-Control-Allow-Origin":  CORS_ALLOW_ORIGIN,
-        "Access-Control-Allow-Methods": CORS_ALLOW_METHODS,
-        "Access-Control-Allow-Headers": CORS_ALLOW_HEADERS,
-        "Content-Type": "application/json; charset=utf-8",
-    }
+# Built once; response dicts share these (API Gateway doesn't mutate them)
+_BASE_HEADERS = {
+    "Access-Control-Allow-Origin":  CORS_ALLOW_ORIGIN,
+    "Access-Control-Allow-Methods": CORS_ALLOW_METHODS,
+    "Access-Control-Allow-Headers": CORS_ALLOW_HEADERS,
+    "Access-Control-Expose-Headers": "X-Next-Cursor",
+    "Content-Type": "application/json; charset=utf-8",
+}
+_PREFLIGHT_HEADERS = {**_BASE_HEADERS, "Access-Control-Max-Age": "600"}
 
-def R(code: int, body=""):
+def R(code: int, body="", headers=None):
     return {
         "statusCode": code,
-        "headers": _headers(),
+        "headers": _BASE_HEADERS | headers if headers else _BASE_HEADERS,
         "body": body if isinstance(body, str) else dumps(body),
     }
 
@@ -55,130 +98,374 @@ def _method(event) -> str:
 def _path(event) -> str:
     return event.get("path") or event.get("rawPath") or "/"
 
+_ITEMS_PREFIX = re.compile(r"/*items/")
+
 def _path_id(event, path: str) -> str | None:
     # 1) Prefer pathParameters.id if provided by API Gateway
     id_from_params = (event.get("pathParameters") or {}).get("id")
     if id_from_params:
         return id_from_params
-    # 2) Fallback: parse /items/{id...}
-    seg = [s for s in path.split("/") if s]
-    if len(seg) >= 2 and seg[0] == "items":
-        return "/".join(seg[1:])
-    return None
+    # 2) Fallback: parse /items/{id...}; empty segments collapse as in "a//b/" -> "a/b"
+    m = _ITEMS_PREFIX.match(path)
+    if not m:
+        return None
+    rest = path[m.end():]
+    if "//" in rest or rest[:1] == "/" or rest[-1:] == "/":
+        rest = "/".join(s for s in rest.split("/") if s)
+    return rest or None
+
+def _query_params(event) -> dict:
+    return event.get("queryStringParameters") or {}
+
+def _parse_limit(v) -> int | None:
+    if v is None or v == "":
+        return None
+    try:
+        n = int(v)
+    except ValueError:
+        n = 0
+    if not 1 <= n <= MAX_LIMIT:
+        raise ValueError(f"limit は 1〜{MAX_LIMIT} の整数で指定してください")
+    return n
+
+def _parse_fields(v) -> tuple:
+    if not v:
+        return LIST_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in v.split(",") if f.strip()))
+    if not fields or not set(fields) <= set(LIST_FIELDS):
+        raise ValueError(f"fields は {','.join(LIST_FIELDS)} から指定してください")
+    return fields
+
+def _encode_cursor(key) -> str | None:
+    # LastEvaluatedKey -> opaque URL-safe token for ?cursor=
+    if not key:
+        return None
+    return base64.urlsafe_b64encode(dumps(key).encode()).decode()
+
+_CURSOR_KEYS = {"id", "type", "date"}   # table key + ByType index keys
+
+def _decode_cursor(token) -> dict | None:
+    if not token:
+        return None
+    try:
+        key = loads(base64.urlsafe_b64decode(token))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    # Must look like a ByType LastEvaluatedKey, else Query fails with a 500
+    if (not isinstance(key, dict) or key.keys() != _CURSOR_KEYS
+            or not all(isinstance(v, str) for v in key.values())):
+        raise ValueError("Invalid cursor")
+    return key
 
 def _parse_json_body(event) -> dict:
     b = event.get("body")
     if not b:
         return {}
     try:
-        return json.loads(b)
+        body = loads(b)
     except Exception as e:
         raise ValueError("Invalid JSON body") from e
+    # Checked once here so handlers can treat body as a dict
+    if not isinstance(body, dict):
+        raise ValueError("JSON本文はオブジェクトで指定してください")
+    return body
 
 # ==== Dynamo helpers ====
-def _scan_all() -> list:
-    """Simple full scan for the exercise (paginated up to all items)."""
-    items, excl = [], None
+def _client():
+    """Low-level DynamoDB client, created on first data access.
+
+    boto3 is imported here rather than at module load so cold starts that only
+    answer OPTIONS preflights skip it. Also sets up _ser/_deser for
+    _to_ddb/_from_ddb (the client skips the resource layer's marshaling).
+    """
+    global _ddb, _ser, _deser
+    if _ddb is None:
+        import boto3
+        from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+        from botocore.config import Config
+        _ser, _deser = TypeSerializer(), TypeDeserializer()
+        _ddb = boto3.client("dynamodb", config=Config(**_CLIENT_CONFIG))
+    return _ddb
+
+def _prefetcher() -> ThreadPoolExecutor:
+    # Built on first list query, so OPTIONS-only cold starts don't create it
+    global _prefetch
+    if _prefetch is None:
+        _prefetch = ThreadPoolExecutor(max_workers=1)
+    return _prefetch
+
+def _to_ddb(d: dict) -> dict:
+    if _ser is None:
+        _client()
+    return {k: _ser.serialize(v) for k, v in d.items()}
+
+def _from_ddb(d: dict | None) -> dict | None:
+    if not d:
+        return None
+    if _deser is None:
+        _client()
+    return {k: _deser.deserialize(v) for k, v in d.items()}
+
+def _public(d: dict | None) -> dict | None:
+    # Deserialize for a response: drops the internal ByType partition attribute
+    item = _from_ddb(d)
+    if item:
+        item.pop("type", None)
+    return item
+
+# Key condition shared by every ByType query (list pages and counts)
+_BY_TYPE = {
+    "TableName": TABLE_NAME,
+    "IndexName": LIST_INDEX,
+    "KeyConditionExpression": "#ty = :ty",
+    "ExpressionAttributeValues": {":ty": {"S": ITEM_TYPE}},
+}
+
+def _query_page(excl: dict | None, limit: int | None, fields: tuple = LIST_FIELDS) -> tuple[list, dict | None]:
+    ddb = _client()
+    # Project only the listed attributes: smaller items, more of them per 1 MB page
+    proj = {f"#f{n}": f for n, f in enumerate(fields)}
+    kwargs = {
+        **_BY_TYPE,
+        "ProjectionExpression": ",".join(proj),
+        "ExpressionAttributeNames": {"#ty": "type", **proj},
+        "ScanIndexForward": False,
+    }
+    if limit:
+        kwargs["Limit"] = limit
+    if excl:
+        kwargs["ExclusiveStartKey"] = _to_ddb(excl)
+    resp = ddb.query(**kwargs)
+    return [_from_ddb(it) for it in resp.get("Items", [])], _from_ddb(resp.get("LastEvaluatedKey"))
+
+def _iter_pages(limit: int | None = None, start: dict | None = None, fields: tuple = LIST_FIELDS):
+    """Yield (items, LastEvaluatedKey) pages of the ByType GSI, newest-first.
+
+    Stops after `limit` items (all items when None). Each Query asks for
+    everything still needed, so a follow-up Query only happens when DynamoDB's
+    1 MB page cap cuts a page short. The next page's Query is submitted before
+    the current page is yielded, so its round-trip overlaps whatever the
+    caller does with the current page.
+    """
+    (items, excl), seen = _query_page(start, limit, fields), 0
+    while True:
+        seen += len(items)
+        if not excl or (limit and seen >= limit):
+            yield items, excl
+            return
+        nxt = _prefetcher().submit(_query_page, excl, limit and limit - seen, fields)
+        yield items, excl
+        items, excl = nxt.result()
+
+def _iter_items(limit: int | None = None, start: dict | None = None, fields: tuple = LIST_FIELDS,
+                tail: dict | None = None):
+    """Flatten _iter_pages(); the key to resume from is left in tail["last"]."""
+    for page, last in _iter_pages(limit, start, fields):
+        if tail is not None:
+            tail["last"] = last
+        yield from page
+
+def _count_items() -> int:
+    """Count via Select=COUNT: DynamoDB returns only Count, no item payload."""
+    ddb = _client()
+    kwargs = {**_BY_TYPE, "ExpressionAttributeNames": {"#ty": "type"}, "Select": "COUNT"}
+    n = 0
     while True:
-        resp = db.scan(**({"ExclusiveStartKey": excl} if excl else {}))
-        items.extend(resp.get("Items", []))
-        excl = resp.get("LastEvaluatedKey")
-        if not excl:
-            break
-    return items
+        resp = ddb.query(**kwargs)
+        n += resp.get("Count", 0)
+        if "LastEvaluatedKey" not in resp:
+            return n
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+def _batch_put(items: list) -> int:
+    """BatchWriteItem, retrying UnprocessedItems with exponential backoff.
+
+    Returns the number of items still unprocessed after the last attempt.
+    """
+    ddb = _client()
+    req = {TABLE_NAME: [{"PutRequest": {"Item": _to_ddb(it)}} for it in items]}
+    for attempt in range(BATCH_RETRIES):
+        if attempt:
+            time.sleep(0.05 * 2 ** attempt)
+        req = ddb.batch_write_item(RequestItems=req).get("UnprocessedItems") or {}
+        if not req:
+            return 0
+    return len(req.get(TABLE_NAME, []))
+
+# ==== Handlers: (id, body, query params) -> response ====
+def _handle_405(i, body, q):
+    # Method not supported for this path
+    return R(405, {"message": "unsupported"})
+
+def _handle_get_item(i, body, q):
+    # GET /items/{id}
+    ddb = _client()
+    res = ddb.get_item(TableName=TABLE_NAME, Key=_to_ddb({"id": i}))
+    return R(200, _public(res.get("Item")))
+
+def _handle_list(i, body, q):
+    # GET /items?count=1
+    if q.get("count") in ("1", "true"):
+        return R(200, {"count": _count_items()})
+    # GET /items[?limit=&cursor=&fields=]
+    tail = {}
+    items = _iter_items(_parse_limit(q.get("limit")), _decode_cursor(q.get("cursor")),
+                        _parse_fields(q.get("fields")), tail=tail)
+    out = _encode_array(items)
+    cursor = _encode_cursor(tail.get("last"))
+    return R(200, out, {"X-Next-Cursor": cursor} if cursor else None)
+
+def _new_item(body) -> dict | None:
+    # None when any of id, description, date is missing/blank
+    required = ("id", "description", "date")
+    if not isinstance(body, dict) or not all(k in body and str(body[k]).strip() for k in required):
+        return None
+    return {
+        "id": str(body["id"]).strip(),
+        "description": str(body["description"]),
+        "date": str(body["date"]),
+        "type": ITEM_TYPE,
+    }
+
+def _handle_post_batch(i, body, q):
+    # POST /items/batch  (expects {"items": [{id, description, date}, ...]}; overwrites existing ids)
+    if i != "batch":
+        return _handle_405(i, body, q)
+    raw = body.get("items")
+    if not isinstance(raw, list) or not 1 <= len(raw) <= BATCH_MAX:
+        return R(400, {"message": f"items は 1〜{BATCH_MAX} 件の配列で指定してください"})
+    items = [_new_item(b) for b in raw]
+    if None in items:
+        return R(400, {"message": "必須項目不足: 各アイテムに id, description, date を指定してください"})
+    if len({it["id"] for it in items}) != len(items):
+        return R(400, {"message": "items 内で id が重複しています"})
+    try:
+        left = _batch_put(items)
+    except ClientError:
+        logger.exception("BatchWriteItem failed")
+        return R(500, {"message": "サーバ内部エラー"})
+    if left:
+        logger.warning("BatchWriteItem left %d unprocessed items", left)
+        return R(503, {"message": "一部のアイテムを書き込めませんでした", "unprocessed": left})
+    return R(200, {"message": "created", "count": len(items)})
+
+def _handle_post(i, body, q):
+    # POST /items  (expects body with id, description, date)
+    item = _new_item(body)
+    if item is None:
+        return R(400, {"message": "必須項目不足: id, description, date を指定してください"})
+    ddb = _client()
+    try:
+        # Avoid accidental overwrite (409 if already exists)
+        ddb.put_item(
+            TableName=TABLE_NAME,
+            Item=_to_ddb(item),
+            ConditionExpression="attribute_not_exists(#k)",
+            ExpressionAttributeNames={"#k": "id"},
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            # The conflicting item comes back in the same call; no extra GET
+            return R(409, {"message": "同じIDが既に存在します", "existing": _public(e.response.get("Item"))})
+        logger.exception("PutItem failed")
+        return R(500, {"message": "サーバ内部エラー"})
+    return R(200, {"message": "created"})
+
+# PUT update expressions keyed by (has description, has date).
+# type is always set so upserted items also land in the ByType index.
+_PUT_SHAPES = {
+    (True, False): ("SET #d=:d, #ty=:ty", {"#d": "description", "#ty": "type"}),
+    (False, True): ("SET #t=:t, #ty=:ty", {"#t": "date", "#ty": "type"}),
+    (True, True):  ("SET #d=:d, #t=:t, #ty=:ty", {"#d": "description", "#t": "date", "#ty": "type"}),
+}
+_TYPE_ATTR = {"S": ITEM_TYPE}
+
+def _str_attr(v) -> dict:
+    # AttributeValue for an optional string field (null clears it)
+    return {"NULL": True} if v is None else {"S": str(v)}
+
+def _handle_put(i, body, q):
+    # PUT /items/{id} (partial update allowed)
+    has_d, has_t = "description" in body, "date" in body
+    shape = _PUT_SHAPES.get((has_d, has_t))
+    if shape is None:
+        return R(400, {"message": "更新対象のフィールドがありません (description / date)"})
+    # date is the ByType sort key: DynamoDB rejects a blank/null index key
+    if has_t and (body["date"] is None or not str(body["date"]).strip()):
+        return R(400, {"message": "date は空にできません"})
+    expr, names = shape
+    values = {":ty": _TYPE_ATTR}
+    if has_d:
+        values[":d"] = _str_attr(body["description"])
+    if has_t:
+        values[":t"] = _str_attr(body["date"])
+    ddb = _client()
+    try:
+        res = ddb.update_item(
+            TableName=TABLE_NAME,
+            Key=_to_ddb({"id": i}),
+            UpdateExpression=expr,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues="UPDATED_NEW",
+        )
+    except ClientError:
+        logger.exception("UpdateItem failed")
+        return R(500, {"message": "サーバ内部エラー"})
+    return R(200, {"message": "updated", "attributes": _public(res.get("Attributes"))})
+
+def _handle_delete(i, body, q):
+    # DELETE /items or /items/{id}
+    del_id = i or body.get("id")
+    if not del_id:
+        return R(400, {"message": "id 必須"})
+    ddb = _client()
+    try:
+        # Conditional so a retried DELETE is detected in the same call
+        ddb.delete_item(
+            TableName=TABLE_NAME,
+            Key=_to_ddb({"id": del_id}),
+            ConditionExpression="attribute_exists(#k)",
+            ExpressionAttributeNames={"#k": "id"},
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return R(200, {"message": "already deleted"})
+        logger.exception("DeleteItem failed")
+        return R(500, {"message": "サーバ内部エラー"})
+    return R(200, {"message": "deleted"})
+
+# (method, has id) -> handler; anything else is 405
+_ROUTES = {
+    ("GET", True): _handle_get_item,
+    ("GET", False): _handle_list,
+    ("POST", True): _handle_post_batch,
+    ("POST", False): _handle_post,
+    ("PUT", True): _handle_put,
+    ("DELETE", True): _handle_delete,
+    ("DELETE", False): _handle_delete,
+}
+
+@lru_cache(maxsize=16)
+def _resolve(m: str, has_id: bool):
+    return _ROUTES.get((m, has_id), _handle_405)
 
 def lambda_handler(event, _context):
     try:
         m = _method(event)
+        # CORS preflight: answered before any parsing/logging; no body
+        if m == "OPTIONS":
+            return {"statusCode": 204, "headers": _PREFLIGHT_HEADERS, "body": ""}
+
         p = _path(event)
         i = _path_id(event, p)
         body = _parse_json_body(event)
 
-        logger.info("Request: method=%s path=%s id=%s bodyKeys=%s",
-                    m, p, i, list(body.keys()) if isinstance(body, dict) else type(body))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Request: method=%s path=%s id=%s bodyKeys=%s", m, p, i, tuple(body))
 
-        # CORS preflight
-        if m == "OPTIONS":
-            # No body for preflight
-            return {
-                "statusCode": 204,
-                "headers": _headers()
-                | {"Access-Control-Max-Age": "600"},
-                "body": ""
-            }
-
-        # GET /items or /items/{id}
-        if m == "GET":
-            if i:
-                res = db.get_item(Key={"id": i})
-                return R(200, res.get("Item"))
-            return R(200, _scan_all())
-
-        # POST /items  (expects body with id, description, date)
-        if m == "POST" and not i:
-            required = ("id", "description", "date")
-            if not isinstance(body, dict) or not all(k in body and str(body[k]).strip() for k in required):
-                return R(400, {"message": "必須項目不足: id, description, date を指定してください"})
-            item = {
-                "id": str(body["id"]).strip(),
-                "description": str(body["description"]),
-                "date": str(body["date"]),
-            }
-            try:
-                # Avoid accidental overwrite (409 if already exists)
-                db.put_item(
-                    Item=item,
-                    ConditionExpression="attribute_not_exists(#k)",
-                    ExpressionAttributeNames={"#k": "id"},
-                )
-            except ClientError as e:
-                if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
-                    return R(409, {"message": "同じIDが既に存在します"})
-                logger.exception("PutItem failed")
-                return R(500, {"message": "サーバ内部エラー"})
-            return R(200, {"message": "created"})
-
-        # PUT /items/{id} (partial update allowed)
-        if m == "PUT" and i:
-            if not isinstance(body, dict):
-                return R(400, {"message": "JSON本文が必要です"})
-            names, values, sets = {}, {}, []
-            if "description" in body:
-                names["#d"] = "description"
-                values[":d"] = None if body["description"] is None else str(body["description"])
-                sets.append("#d=:d")
-            if "date" in body:
-                names["#t"] = "date"
-                values[":t"] = None if body["date"] is None else str(body["date"])
-                sets.append("#t=:t")
-            if not sets:
-                return R(400, {"message": "更新対象のフィールドがありません (description / date)"})
-            try:
-                db.update_item(
-                    Key={"id": i},
-                    UpdateExpression="SET " + ", ".join(sets),
-                    ExpressionAttributeNames=names,
-                    ExpressionAttributeValues=values,
-                )
-            except ClientError:
-                logger.exception("UpdateItem failed")
-                return R(500, {"message": "サーバ内部エラー"})
-            return R(200, {"message": "updated"})
-
-        # DELETE /items or /items/{id}
-        if m == "DELETE":
-            del_id = i or (body.get("id") if isinstance(body, dict) else None)
-            if not del_id:
-                return R(400, {"message": "id 必須"})
-            try:
-                db.delete_item(Key={"id": del_id})
-            except ClientError:
-                logger.exception("DeleteItem failed")
-                return R(500, {"message": "サーバ内部エラー"})
-            return R(200, {"message": "deleted"})
-
-        # Method not supported for this path
-        return R(405, {"message": "unsupported"})
+        return _resolve(m, bool(i))(i, body, _query_params(event))
 
     except ValueError as ve:
         # e.g., invalid JSON